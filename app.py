@@ -1,22 +1,42 @@
 import os
-import json
+import asyncio
+import hashlib
 import boto3
-import traceback
+import aioboto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from boto3.dynamodb.types import TypeSerializer
 import time
 from time import gmtime, strftime
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import httpx
+import orjson
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry as RedisRetry
+from celery import Celery
+from celery.result import AsyncResult
 import logging
-from pydantic import BaseModel, Field, ValidationError
-from typing import List, Optional
-from openai import OpenAI
+from pythonjsonlogger.json import JsonFormatter
+import msgspec
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Optional
+from openai import OpenAI, AsyncOpenAI
 
 # ------------------- Logging -------------------
-logging.basicConfig(level=logging.INFO)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(JsonFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+logging.basicConfig(level=logging.INFO, handlers=[log_handler])
 logger = logging.getLogger(__name__)
 
 # ------------------- Load Env -------------------
@@ -26,7 +46,25 @@ if os.path.exists(dotenv_path):
     load_dotenv(dotenv_path)
 
 # ------------------- Flask App -------------------
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Serve request.json and jsonify through orjson. Types orjson does not
+    handle natively (e.g. Decimal from DynamoDB) fall back to Flask's default.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json_provider_class = OrjsonProvider
+app.json = OrjsonProvider(app)
 CORS(
     app,
     resources={r"/*": {"origins": r".*"}},
@@ -42,22 +80,37 @@ aws_access_key = os.getenv("AWS_ACCESS_KEY_ID")
 aws_secret_key = os.getenv("AWS_SECRET_ACCESS_KEY")
 aws_region = os.getenv("AWS_DEFAULT_REGION", "us-west-2")
 
+# Shared client tuning: a pool sized for concurrent handlers, adaptive retries
+# that back off on throttling, and keepalive so idle sockets are not left in
+# CLOSE_WAIT. Default botocore allows only 10 pooled connections.
+aws_config = Config(
+    max_pool_connections=64,
+    retries={"max_attempts": 10, "mode": "adaptive"},
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=5
+)
+# RequestResponse invokes wait for the whole Lambda run (15 min max)
+lambda_config = aws_config.merge(Config(read_timeout=900))
+
 dynamodb = boto3.resource(
     "dynamodb",
     region_name=aws_region,
     aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key
+    aws_secret_access_key=aws_secret_key,
+    config=aws_config
 )
 
-lambda_client = boto3.client(
-    "lambda",
+s3_client = boto3.client(
+    "s3",
     region_name=aws_region,
     aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key
+    aws_secret_access_key=aws_secret_key,
+    config=aws_config
 )
 
-s3_client = boto3.client(
-    "s3",
+# Async session for I/O-bound waits; clients are opened per event loop
+aio_session = aioboto3.Session(
     region_name=aws_region,
     aws_access_key_id=aws_access_key,
     aws_secret_access_key=aws_secret_key
@@ -71,9 +124,44 @@ subject_table = dynamodb.Table(os.getenv("SUBJECT_TABLE", "Grade_and_Subject"))
 Question_Prod = dynamodb.Table(os.getenv("QUIZ_TABLE", "Question"))
 User_ITP_Prod = dynamodb.Table(os.getenv("USER_ITP_TABLE", "User_Infinite_TestSeries"))
 
+# Lessons from process_all are all created under this tenant
+LESSON_TENANT_EMAIL = "sierracanyon@edyou.com"
+LESSON_TENANT_NAME = "Sierra Canyon"
+LESSON_ICON = "https://pollydemo2022.s3.us-west-2.amazonaws.com/icons/homework.png"
+
+# Grade_and_Subject is written through the low-level client; attributes that
+# are the same for every lesson are marshalled to AttributeValues once.
+dynamo_serializer = TypeSerializer()
+GRADE_SUBJECT_STATIC_ITEM = {
+    key: dynamo_serializer.serialize(value)
+    for key, value in {
+        "status": "Active",
+        "tenantEmail": LESSON_TENANT_EMAIL,
+        "tenantName": LESSON_TENANT_NAME,
+        "quiz_credit": Decimal(0),
+        "course_credit": Decimal(0),
+        "icon": LESSON_ICON
+    }.items()
+}
+
+# Parallel Investor updates per request. Size to the table's write capacity;
+# throttled writes are backed off by the adaptive retry mode in aws_config.
+STUDENT_UPDATE_WORKERS = int(os.getenv("STUDENT_UPDATE_WORKERS", "16"))
+
+# In-flight student lookup/assign calls per process_all request
+STUDENT_ASSIGN_CONCURRENCY = 20
+
 # S3
 BUCKET_NAME = "icp-image-gen"
 
+# Multipart uploads with parallel parts above 8 MB; smaller files go in one PUT
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=10,
+    use_threads=True
+)
+
 # External URLs
 url_insert_subject = os.getenv("URL_INSERT_SUBJECT")
 url_get_school = os.getenv("URL_GET_SCHOOL")
@@ -81,13 +169,112 @@ url_insert_lesson_planner = os.getenv("URL_INSERT_LESSON_PLANNER")
 url_itp_initialize = "https://nycoxziw67.execute-api.us-west-2.amazonaws.com/Production/api/initialize"
 url_icp_generate = os.getenv("URL_ICP_GENERATE")
 
+# Optional bulk variant of get_student_by_email taking {"emails": [...]}
+url_get_students_bulk = os.getenv("URL_GET_STUDENTS_BULK")
+
+# ------------------- HTTP Session -------------------
+# Keep-alive connection pool shared by the outbound API helpers
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 502, 503, 504])
+))
+http_session.headers.update({"Content-Type": "application/json"})
+
+# API Gateway headers, built once at import
+SCHOOL_API_HEADERS = {
+    "x-api-key": os.getenv("LESSON_PLANNER_API_KEY"),
+    "Content-Type": "application/json"
+}
+POSTGRES_API_HEADERS = {
+    "x-api-key": os.getenv("LESSON_PLANNER_API_KEY", "oxcoUnpFS89Cu43FvFMGa5ZA5C6Ykxd79sXnuJhh"),
+    "Content-Type": "application/json"
+}
+
+# Async views open an httpx client per request (pools are bound to the view's
+# event loop). No read timeout: ITP init and course generation run for minutes.
+OUTBOUND_HTTP_TIMEOUT = httpx.Timeout(None, connect=10)
+
+# ------------------- Cache -------------------
+# Shared across workers; caching is skipped when REDIS_URL is not configured.
+redis_url = os.getenv("REDIS_URL")
+# Short timeouts and no retries, so an unreachable or stuck Redis reads as a
+# cache miss instead of hanging the request
+redis_client = redis.Redis.from_url(
+    redis_url,
+    socket_connect_timeout=0.25,
+    socket_timeout=0.25,
+    retry=RedisRetry(NoBackoff(), 0)
+) if redis_url else None
+
+QUESTION_CACHE_TTL = 86400  # seconds
+STUDENT_ID_CACHE_TTL = 3600  # seconds
+SCHOOL_ID_CACHE_TTL = 86400  # seconds
+
+
+def cache_get(key):
+    if redis_client is None:
+        return None
+    try:
+        return redis_client.get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Cache read failed for {key}: {e}")
+        return None
+
+
+def cache_set(key, value, ttl):
+    if redis_client is None:
+        return
+    try:
+        redis_client.setex(key, ttl, value)
+    except redis.RedisError as e:
+        logger.warning(f"Cache write failed for {key}: {e}")
+
+
+def cache_get_many(keys):
+    if redis_client is None or not keys:
+        return [None] * len(keys)
+    try:
+        return redis_client.mget(keys)
+    except redis.RedisError as e:
+        logger.warning(f"Cache read failed for {len(keys)} keys: {e}")
+        return [None] * len(keys)
+
+
+def cache_set_many(values, ttl):
+    if redis_client is None or not values:
+        return
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.setex(key, ttl, value)
+            pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Cache write failed for {len(values)} keys: {e}")
+
+# ------------------- Background Jobs -------------------
+# Worker: celery -A app.celery worker. Tasks are queued only when
+# CELERY_BROKER_URL is set explicitly; otherwise routes call them inline. Job
+# status needs a result backend (CELERY_RESULT_BACKEND), which an SQS broker
+# cannot be.
+celery_broker_url = os.getenv("CELERY_BROKER_URL")
+celery_result_backend = os.getenv("CELERY_RESULT_BACKEND")
+celery = Celery("app", broker=celery_broker_url, backend=celery_result_backend)
+
 # ------------------- OpenAI Client -------------------
+openai_api_key = os.getenv("OPENAI_API_KEY")
 try:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = OpenAI(api_key=openai_api_key)
 except Exception as e:
     logger.error(f"Failed to initialize OpenAI client: {e}")
     raise
 
+# Max in-flight completions per batch request
+BATCH_GENERATE_CONCURRENCY = 8
+# Max questions per batch request; larger batches are rejected with a 400
+BATCH_GENERATE_MAX_REQUESTS = 20
+
 # ==================== AI Question Generation Models ====================
 
 class QuizQuestion(BaseModel):
@@ -105,27 +292,44 @@ class QuizQuestion(BaseModel):
 class QuizResponse(BaseModel):
     questions: List[QuizQuestion]
 
-class GenerateRequest(BaseModel):
+# Request bodies are decoded and validated by msgspec in a single pass;
+# QuizQuestion stays on Pydantic because the OpenAI SDK parses into it.
+Difficulty = Annotated[str, msgspec.Meta(pattern="^(easy|medium|hard)$")]
+
+class GenerateRequest(msgspec.Struct, kw_only=True):
     subject: str
     topic: str
     subtopic: Optional[str] = None
     grade_level: str
-    difficulty: str = Field(..., pattern="^(easy|medium|hard)$")
+    difficulty: Difficulty
     learning_style: Optional[str] = None
     additional_context: Optional[str] = None
+    # Opt in to reusing a question generated for identical parameters within
+    # QUESTION_CACHE_TTL. Off by default: callers that build a quiz by repeating
+    # the same request expect a fresh question each time.
+    cache: bool = False
 
+# Response envelopes only ever wrap questions the OpenAI SDK (or the cache)
+# has already validated, so routes build them with model_construct.
 class GenerateResponse(BaseModel):
     success: bool
     question: Optional[QuizQuestion] = None
     error_message: Optional[str] = None
 
-class RegenerateRequest(BaseModel):
+class BatchGenerateRequest(msgspec.Struct):
+    requests: Annotated[List[GenerateRequest], msgspec.Meta(max_length=BATCH_GENERATE_MAX_REQUESTS)]
+
+class BatchGenerateResponse(BaseModel):
+    success: bool
+    results: List[GenerateResponse]
+
+class RegenerateRequest(msgspec.Struct):
     current_question: dict
     edit_instruction: str
     subject: str
     topic: str
     grade_level: str
-    difficulty: str = Field(..., pattern="^(easy|medium|hard)$")
+    difficulty: Difficulty
 
 class RegenerateResponse(BaseModel):
     success: bool
@@ -135,8 +339,7 @@ class RegenerateResponse(BaseModel):
 
 # ==================== Helper Functions ====================
 
-def create_system_prompt():
-    return """You are an expert educator creating high-quality quiz questions.
+SYSTEM_PROMPT = """You are an expert educator creating high-quality quiz questions.
 
 STRICT FORMATTING AND CONTENT RULES:
 1. Question Type Variety:
@@ -157,14 +360,8 @@ STRICT FORMATTING AND CONTENT RULES:
    - The option letter/number will be added by the backend
 """
 
-def format_generate_prompt(request: GenerateRequest) -> str:
-    prompt = f"""Create a {request.difficulty} quiz question for {request.subject} 
-on {request.topic}{f' - {request.subtopic}' if request.subtopic else ''} 
-for {request.grade_level} students.
-
-Requirements:
-- Create exactly 4 multiple choice options
-- STRICT CONTENT RULES:
+# Rule block shared verbatim by the generate and regenerate prompts
+PROMPT_RULES = """- STRICT CONTENT RULES:
   * Include a mix of fact-based and application-based questions
   * Do NOT ask questions that ask to explain or describe a solution
   * Do NOT include questions requiring drawing graphs/diagrams/number lines
@@ -178,9 +375,29 @@ Requirements:
   * Incorrect answers: "is incorrect because [detailed explanation]"
   * Start explanations EXACTLY with these phrases (no text before)
   * Provide specific explanations that address misconceptions
-- Ensure only one correct answer
-- Options should be labeled as A, B, C, D in the options__00X fields
 """
+
+OPTION_LABEL_RULE = "- Options should be labeled as A, B, C, D in the options__00X fields\n"
+
+GENERATE_REQUIREMENTS = (
+    "\nRequirements:\n"
+    "- Create exactly 4 multiple choice options\n"
+    + PROMPT_RULES
+    + "- Ensure only one correct answer\n"
+    + OPTION_LABEL_RULE
+)
+
+def create_system_prompt():
+    return SYSTEM_PROMPT
+
+def format_generate_prompt(request: GenerateRequest) -> str:
+    subtopic = f' - {request.subtopic}' if request.subtopic else ''
+    prompt = (
+        f"Create a {request.difficulty} quiz question for {request.subject} \n"
+        f"on {request.topic}{subtopic} \n"
+        f"for {request.grade_level} students.\n"
+        + GENERATE_REQUIREMENTS
+    )
     if request.learning_style:
         prompt += f"- Adapt for {request.learning_style} learners\n"
     if request.additional_context:
@@ -188,31 +405,36 @@ Requirements:
     return prompt
 
 def format_regenerate_prompt(request: RegenerateRequest) -> str:
-    current = request.current_question
-    correct_answer = current.get('CorrectAnswer', 1)
-    return f"""Modify this quiz question with instruction: {request.edit_instruction}
-Keep subject={request.subject}, topic={request.topic}, grade={request.grade_level}, difficulty={request.difficulty}.
-Requirements:
-- Regenerate the COMPLETE question with all coherent parts
-- Update ALL options and descriptions to match the changes
-- Maintain {request.difficulty} difficulty level for {request.grade_level}
-- STRICT CONTENT RULES:
-  * Include a mix of fact-based and application-based questions
-  * Do NOT ask questions that ask to explain or describe a solution
-  * Do NOT include questions requiring drawing graphs/diagrams/number lines
-  * Do NOT ask questions that refer to graphs/diagrams/number lines to solve
-- STRICT MATH FORMATTING:
-  * Use \\(...\\) for ALL inline mathematical expressions
-  * Use \\[...\\] for ALL block/display mathematical expressions
-  * NEVER use $...$ or $$...$$ delimiters
-- STRICT EXPLANATION FORMAT:
-  * Correct answer: "is correct because [detailed explanation]"
-  * Incorrect answers: "is incorrect because [detailed explanation]"
-  * Start explanations EXACTLY with these phrases (no text before)
-  * Provide specific explanations that address misconceptions
-- Keep the subject ({request.subject}) and topic ({request.topic}) consistent
-- Options should be labeled as A, B, C, D in the options__00X fields
-"""
+    return (
+        f"Modify this quiz question with instruction: {request.edit_instruction}\n"
+        f"Keep subject={request.subject}, topic={request.topic}, grade={request.grade_level}, difficulty={request.difficulty}.\n"
+        "Requirements:\n"
+        "- Regenerate the COMPLETE question with all coherent parts\n"
+        "- Update ALL options and descriptions to match the changes\n"
+        f"- Maintain {request.difficulty} difficulty level for {request.grade_level}\n"
+        + PROMPT_RULES
+        + f"- Keep the subject ({request.subject}) and topic ({request.topic}) consistent\n"
+        + OPTION_LABEL_RULE
+    )
+
+def question_cache_key(request: GenerateRequest) -> str:
+    # Struct fields encode in declaration order, so this is already canonical
+    canonical = msgspec.json.encode(request)
+    return f"qgen:{hashlib.sha256(canonical).hexdigest()}"
+
+def question_completion_args(user_prompt: str) -> dict:
+    """
+    Model, messages and response format shared by every question generation
+    call, sync or async, so the routes cannot drift apart.
+    """
+    return {
+        "model": "gpt-4o-2024-08-06",
+        "messages": [
+            {"role": "system", "content": create_system_prompt()},
+            {"role": "user", "content": user_prompt}
+        ],
+        "response_format": QuizResponse
+    }
 
 def detect_changes(current_question: dict, new_question: QuizQuestion) -> List[str]:
     changes = []
@@ -221,62 +443,96 @@ def detect_changes(current_question: dict, new_question: QuizQuestion) -> List[s
     changes.append("All options and explanations regenerated")
     return changes
 
+async def generate_question_async(aclient: AsyncOpenAI, req: GenerateRequest) -> QuizQuestion:
+    response = await aclient.beta.chat.completions.parse(**question_completion_args(format_generate_prompt(req)))
+    return response.choices[0].message.parsed.questions[0]
+
 # ==================== AI Question Generation Endpoints ====================
 
 @app.route("/api/ai/generate-question", methods=["POST"])
 def generate_question():
     try:
-        data = request.json
-        req = GenerateRequest(**data)
-
-        system_prompt = create_system_prompt()
-        user_prompt = format_generate_prompt(req)
-
-        response = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format=QuizResponse
-        )
+        req = msgspec.json.decode(request.get_data(), type=GenerateRequest)
+
+        if req.cache:
+            cache_key = question_cache_key(req)
+            cached = cache_get(cache_key)
+            if cached is not None:
+                question = QuizQuestion.model_validate_json(cached)
+                return jsonify(GenerateResponse.model_construct(success=True, question=question).model_dump(mode="json")), 200
+
+        response = client.beta.chat.completions.parse(**question_completion_args(format_generate_prompt(req)))
 
         quiz_data = response.choices[0].message.parsed
         question = quiz_data.questions[0]
+        if req.cache:
+            cache_set(cache_key, question.model_dump_json(), QUESTION_CACHE_TTL)
 
-        return jsonify(GenerateResponse(success=True, question=question).dict()), 200
+        return jsonify(GenerateResponse.model_construct(success=True, question=question).model_dump(mode="json")), 200
 
-    except ValidationError as ve:
+    except msgspec.DecodeError as ve:
         return jsonify({"success": False, "error_message": str(ve)}), 400
     except Exception as e:
         logger.error(f"Error generating question: {str(e)}")
         return jsonify({"success": False, "error_message": str(e)}), 500
 
+@app.route("/api/ai/generate-questions-batch", methods=["POST"])
+async def generate_questions_batch():
+    try:
+        batch = msgspec.json.decode(request.get_data(), type=BatchGenerateRequest)
+        sem = asyncio.Semaphore(BATCH_GENERATE_CONCURRENCY)
+
+        # Same opt-in question cache as /api/ai/generate-question
+        async def _generate_one(aclient, req):
+            if req.cache:
+                cached = cache_get(question_cache_key(req))
+                if cached is not None:
+                    return QuizQuestion.model_validate_json(cached)
+            async with sem:
+                question = await generate_question_async(aclient, req)
+            if req.cache:
+                cache_set(question_cache_key(req), question.model_dump_json(), QUESTION_CACHE_TTL)
+            return question
+
+        # The async client's connection pool is bound to the running loop, and
+        # Flask gives every async view its own loop, so open it per request.
+        async with AsyncOpenAI(api_key=openai_api_key) as aclient:
+            results = await asyncio.gather(
+                *[_generate_one(aclient, req) for req in batch.requests],
+                return_exceptions=True
+            )
+
+        responses = []
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error generating question in batch: {str(result)}")
+                responses.append(GenerateResponse.model_construct(success=False, error_message=str(result)))
+            else:
+                responses.append(GenerateResponse.model_construct(success=True, question=result))
+
+        success = all(r.success for r in responses)
+        return jsonify(BatchGenerateResponse.model_construct(success=success, results=responses).model_dump(mode="json")), 200
+
+    except msgspec.DecodeError as ve:
+        return jsonify({"success": False, "error_message": str(ve)}), 400
+    except Exception as e:
+        logger.error(f"Error generating question batch: {str(e)}")
+        return jsonify({"success": False, "error_message": str(e)}), 500
+
 @app.route("/api/ai/regenerate-question", methods=["POST"])
 def regenerate_question():
     try:
-        data = request.json
-        req = RegenerateRequest(**data)
-
-        system_prompt = create_system_prompt()
-        user_prompt = format_regenerate_prompt(req)
-
-        response = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format=QuizResponse
-        )
+        req = msgspec.json.decode(request.get_data(), type=RegenerateRequest)
+
+        response = client.beta.chat.completions.parse(**question_completion_args(format_regenerate_prompt(req)))
 
         quiz_data = response.choices[0].message.parsed
         question = quiz_data.questions[0]
         changes = detect_changes(req.current_question, question)
 
-        return jsonify(RegenerateResponse(success=True, regenerated_question=question, changes_summary=changes).dict()), 200
+        return jsonify(RegenerateResponse.model_construct(success=True, regenerated_question=question, changes_summary=changes).model_dump(mode="json")), 200
 
-    except ValidationError as ve:
+    except msgspec.DecodeError as ve:
         return jsonify({"success": False, "error_message": str(ve)}), 400
     except Exception as e:
         logger.error(f"Error regenerating question: {str(e)}")
@@ -303,7 +559,8 @@ def upload_file():
             file,
             BUCKET_NAME,
             key,
-            ExtraArgs={"ContentType": file.content_type}
+            ExtraArgs={"ContentType": file.content_type},
+            Config=UPLOAD_TRANSFER_CONFIG
         )
 
         # Build file URL (public if bucket policy/ACL allows, or serve via CloudFront)
@@ -312,28 +569,41 @@ def upload_file():
         return jsonify({"fileUrl": file_url}), 200
 
     except Exception as e:
-        print("=== [UPLOAD_FILE ERROR] ===")
-        print(traceback.format_exc())
+        logger.exception("upload_file failed")
         return jsonify({"error": str(e)}), 500
 
 
 # ------------------- Helper Functions -------------------
+def get_school_id(tenantEmail):
+    """
+    Resolve the school_id for a tenant email. Found ids are cached for a day.
+    """
+    cache_key = f"school:{tenantEmail}"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return orjson.loads(cached)
+
+    headers = SCHOOL_API_HEADERS
+    school_resp = http_session.post(
+        url_get_school,
+        headers=headers,
+        data=orjson.dumps({"email": tenantEmail})
+    )
+    school_id = None
+    if school_resp.text.strip():
+        data = orjson.loads(school_resp.content)
+        if isinstance(data, list) and data:
+            school_id = data[0].get("school_id")
+
+    if school_id:
+        cache_set(cache_key, orjson.dumps(school_id), SCHOOL_ID_CACHE_TTL)
+    return school_id
+
+
 def insert_into_school(tenantEmail, grade, section, period, grade_and_subject_ui):
-    headers = {
-        "x-api-key": os.getenv("LESSON_PLANNER_API_KEY"),
-        "Content-Type": "application/json"
-    }
+    headers = SCHOOL_API_HEADERS
     try:
-        school_resp = requests.post(
-            url_get_school,
-            headers=headers,
-            data=json.dumps({"email": tenantEmail})
-        )
-        school_id = None
-        if school_resp.text.strip():
-            data = school_resp.json()
-            if isinstance(data, list) and data:
-                school_id = data[0].get("school_id")
+        school_id = get_school_id(tenantEmail)
 
         if school_id:
             payload = {
@@ -343,18 +613,18 @@ def insert_into_school(tenantEmail, grade, section, period, grade_and_subject_ui
                 "school_id": school_id,
                 "period": period
             }
-            resp = requests.post(url_insert_subject, headers=headers, json=payload)
-            print(f"[Insert Subject API] status={resp.status_code}, response={resp.text}")
+            resp = http_session.post(url_insert_subject, headers=headers, data=orjson.dumps(payload))
+            logger.info("[Insert Subject API] status=%s, response=%s", resp.status_code, resp.text)
 
             if resp.status_code == 200 and resp.text.strip():
                 try:
-                    body = resp.json()
+                    body = orjson.loads(resp.content)
                     return body.get("inserted_subject_id")   # <-- correct key
                 except:
                     pass
         return None
     except Exception as e:
-        print(f"Failed to insert into school API: {e}")
+        logger.warning("Failed to insert into school API: %s", e)
         return None
 
 
@@ -363,10 +633,7 @@ def insert_subject_teacher_relation(subject_id, teacher_id):
     Insert subject-teacher relation into Postgres via API Gateway.
     """
     url = "https://48czgcfeuc.execute-api.us-west-2.amazonaws.com/prod/query?query_name=insert_subject_teacher"
-    headers = {
-        "x-api-key": os.getenv("LESSON_PLANNER_API_KEY", "oxcoUnpFS89Cu43FvFMGa5ZA5C6Ykxd79sXnuJhh"),
-        "Content-Type": "application/json"
-    }
+    headers = POSTGRES_API_HEADERS
 
     payload = {
         "subject_id": str(subject_id),
@@ -376,15 +643,15 @@ def insert_subject_teacher_relation(subject_id, teacher_id):
         "school_year_id": ""
     }
 
-    print("[DEBUG] Posting subject-teacher relation:", json.dumps(payload, indent=2))
+    logger.debug("Posting subject-teacher relation: %s", payload)
 
-    resp = requests.post(url, headers=headers, json=payload)
-    print(f"[Subject-Teacher API] status={resp.status_code}, response={resp.text}")
+    resp = http_session.post(url, headers=headers, data=orjson.dumps(payload))
+    logger.info("[Subject-Teacher API] status=%s, response=%s", resp.status_code, resp.text)
 
     if resp.status_code != 200:
         raise Exception(f"Insert subject-teacher relation failed (HTTP {resp.status_code}): {resp.text}")
 
-    return resp.json() if resp.text.strip() else {}
+    return orjson.loads(resp.content) if resp.content.strip() else {}
 
 def insert_lesson_planner_payload(lesson_data):
     """
@@ -395,20 +662,16 @@ def insert_lesson_planner_payload(lesson_data):
     }
     """
     url = "https://48czgcfeuc.execute-api.us-west-2.amazonaws.com/prod/insert?query_name=insert_lesson_planner_payload"
-    headers = {
-        "x-api-key": os.getenv("LESSON_PLANNER_API_KEY", "oxcoUnpFS89Cu43FvFMGa5ZA5C6Ykxd79sXnuJhh"),
-        "Content-Type": "application/json",
-    }
+    headers = POSTGRES_API_HEADERS
 
     # Build EXACT payload (no "params")
     payload = {"lesson_planner": lesson_data}
 
     # log what we're sending
-    print("[DEBUG] Posting (NO params) payload to Postgres API:\n",
-          json.dumps(payload, indent=2)[:2000])
+    logger.debug("Posting (NO params) payload to Postgres API: %.2000s", payload)
 
-    resp = requests.post(url, headers=headers, json=payload)
-    print(f"[Postgres API] status={resp.status_code}, response={resp.text}")
+    resp = http_session.post(url, headers=headers, data=orjson.dumps(payload))
+    logger.info("[Postgres API] status=%s, response=%s", resp.status_code, resp.text)
 
     # Basic failure surfacing
     if resp.status_code != 200:
@@ -416,73 +679,84 @@ def insert_lesson_planner_payload(lesson_data):
 
     # API returns 200 with error body in some cases; check that too
     try:
-        body = resp.json()
+        body = orjson.loads(resp.content)
         if isinstance(body, dict) and body.get("error"):
             raise Exception(f"Postgres insert failed: {resp.text}")
     except ValueError:
         # Non-JSON success body, assume OK
         pass
 
+def _append_subject(email, lesson_uuid):
+    try:
+        Investor.update_item(
+            Key={"email": email},
+            UpdateExpression="SET subject_list = list_append(if_not_exists(subject_list, :empty), :new)",
+            ConditionExpression="attribute_exists(email) AND NOT contains(subject_list, :uuid)",
+            ExpressionAttributeValues={":empty": [], ":new": [lesson_uuid], ":uuid": lesson_uuid},
+            ReturnValuesOnConditionCheckFailure="ALL_OLD"
+        )
+        return "updated"
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        # ALL_OLD only carries an Item when the student row exists
+        return "already_linked" if "Item" in e.response else "not_found"
+
+
+def link_subject_to_student(email, lesson_uuid):
+    """
+    Atomically append lesson_uuid to a student's subject_list, retrying with
+    the lowercased email. Returns (status, stored_email) where status is
+    "updated", "already_linked" or "not_found".
+    """
+    # First attempt: as-is
+    status = _append_subject(email, lesson_uuid)
+
+    # If not found, retry with lowercase
+    if status == "not_found" and email.lower() != email:
+        email = email.lower()
+        status = _append_subject(email, lesson_uuid)
+
+    return status, email
+
 def update_student_subject_list(student_email, lesson_uuid):
     try:
-        # First attempt: as-is
-        resp = Investor.get_item(Key={"email": student_email})
-        
-        # If not found, retry with lowercase
-        if "Item" not in resp and student_email.lower() != student_email:
-            resp = Investor.get_item(Key={"email": student_email.lower()})
-
-        if "Item" not in resp:
-            print(f"Student {student_email} not found in Investor (even after lowercase check)")
-            return
-
-        student_item = resp["Item"]
-        subject_list = student_item.get("subject_list", [])
-
-        if lesson_uuid not in subject_list:
-            subject_list.append(lesson_uuid)
-            Investor.update_item(
-                Key={"email": student_item["email"]},  # use the actual stored key
-                UpdateExpression="SET subject_list = :s",
-                ExpressionAttributeValues={":s": subject_list}
-            )
-            print(f"Added {lesson_uuid} to {student_item['email']}'s subject_list")
+        status, stored_email = link_subject_to_student(student_email, lesson_uuid)
+        if status == "not_found":
+            logger.info("Student %s not found in Investor (even after lowercase check)", student_email)
+        elif status == "updated":
+            logger.info("Added %s to %s's subject_list", lesson_uuid, stored_email)
     except Exception as e:
-        print(f"Error updating student {student_email}: {e}")
+        logger.error("Error updating student %s: %s", student_email, e)
 
-def get_student_id_by_email(email):
+async def get_student_id_by_email(http, email):
     """
     Fetch student_id for a given student email.
-    Uses fixed school_id=3.
+    Uses fixed school_id=3. Callers own caching (see assign_subject_to_students).
     """
     url = "https://48czgcfeuc.execute-api.us-west-2.amazonaws.com/prod/query?query_name=get_student_by_email"
-    headers = {
-        "x-api-key": os.getenv("LESSON_PLANNER_API_KEY", "oxcoUnpFS89Cu43FvFMGa5ZA5C6Ykxd79sXnuJhh"),
-        "Content-Type": "application/json"
-    }
+    headers = POSTGRES_API_HEADERS
     payload = {"email": email, "school_id": 3}
-    resp = requests.get(url, headers=headers, json=payload)
-    print(f"[GET Student] status={resp.status_code}, response={resp.text}")
+    # The query API reads its parameters from a GET body
+    resp = await http.request("GET", url, headers=headers, content=orjson.dumps(payload))
+    logger.info("[GET Student] status=%s, response=%s", resp.status_code, resp.text)
 
     if resp.status_code == 200 and resp.text.strip():
         try:
-            body = resp.json()
+            body = orjson.loads(resp.content)
             if isinstance(body, list) and body:
                 return body[0].get("student_id")
         except Exception as e:
-            print(f"Error parsing student response: {e}")
+            logger.warning("Error parsing student response: %s", e)
     return None
 
 
-def assign_subject_to_student(student_id, subject_id):
+async def assign_subject_to_student(http, student_id, subject_id):
     """
     Assign subject to student via API.
     """
     url = "https://48czgcfeuc.execute-api.us-west-2.amazonaws.com/prod/query?query_name=assign_subject_to_student"
-    headers = {
-        "x-api-key": os.getenv("LESSON_PLANNER_API_KEY", "oxcoUnpFS89Cu43FvFMGa5ZA5C6Ykxd79sXnuJhh"),
-        "Content-Type": "application/json"
-    }
+    headers = POSTGRES_API_HEADERS
     payload = {
         "student_id": str(student_id),
         "subject_id": str(subject_id),
@@ -490,48 +764,256 @@ def assign_subject_to_student(student_id, subject_id):
         "is_homeroom": "False",
         "school_year_id": ""
     }
-    resp = requests.post(url, headers=headers, json=payload)
-    print(f"[Assign Subject] status={resp.status_code}, response={resp.text}")
-    return resp.json() if resp.text.strip() else {}
+    resp = await http.post(url, headers=headers, content=orjson.dumps(payload))
+    logger.info("[Assign Subject] status=%s, response=%s", resp.status_code, resp.text)
+    return orjson.loads(resp.content) if resp.content.strip() else {}
+
+
+async def get_student_ids_bulk(http, emails):
+    """
+    Fetch student_ids for many emails in one call.
+    Uses fixed school_id=3. Returns {lowercased email: student_id} for the
+    students found, or None when the call fails so callers can fall back to
+    per-email lookups.
+    """
+    headers = POSTGRES_API_HEADERS
+    payload = {"emails": emails, "school_id": 3}
+    try:
+        resp = await http.post(url_get_students_bulk, headers=headers, content=orjson.dumps(payload))
+    except httpx.HTTPError as e:
+        logger.warning("Bulk student lookup failed: %s", e)
+        return None
+    logger.info("[GET Students Bulk] status=%s, count=%d", resp.status_code, len(emails))
+
+    if resp.status_code != 200 or not resp.content.strip():
+        return None
+    try:
+        body = orjson.loads(resp.content)
+        if not isinstance(body, list):
+            return None
+        return {
+            row["email"].lower(): row["student_id"]
+            for row in body
+            if row.get("email") and row.get("student_id")
+        }
+    except Exception as e:
+        logger.warning("Error parsing bulk student response: %s", e)
+        return None
+
+
+async def assign_subject_to_students(students, subject_id):
+    """
+    Look up and assign every student concurrently.
+    Returns (email, student_id, assign_resp) per student, in input order;
+    student_id is None when the lookup found nothing. Per-email lookups are
+    cached for an hour; the cache is read in one MGET before the fan-out and
+    written in one pipeline after it, so Redis never blocks the event loop
+    mid-gather.
+    """
+    sem = asyncio.Semaphore(STUDENT_ASSIGN_CONCURRENCY)
+    fetched_ids = {}
+
+    async def lookup_and_assign(http, student_email, known_ids):
+        async with sem:
+            if student_email in known_ids:
+                student_id = known_ids[student_email]
+            else:
+                student_id = await get_student_id_by_email(http, student_email)
+                if student_id:
+                    fetched_ids[f"sid:{student_email}"] = orjson.dumps(student_id)
+            if not student_id:
+                return student_email, None, None
+            assign_resp = await assign_subject_to_student(http, student_id, subject_id)
+            return student_email, student_id, assign_resp
+
+    limits = httpx.Limits(max_connections=STUDENT_ASSIGN_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=30, limits=limits) as http:
+        # One round trip for every lookup when the bulk query is deployed;
+        # a failed bulk call leaves student_ids None and each email is looked up
+        student_ids = None
+        if url_get_students_bulk:
+            student_ids = await get_student_ids_bulk(http, students)
+
+        if student_ids is not None:
+            # Students missing from the bulk reply are not found, not re-fetched
+            known_ids = {e: student_ids.get(e.lower()) for e in students}
+        else:
+            cached = cache_get_many([f"sid:{e}" for e in students])
+            known_ids = {e: orjson.loads(v) for e, v in zip(students, cached) if v is not None}
+
+        results = await asyncio.gather(*[lookup_and_assign(http, e, known_ids) for e in students])
+        cache_set_many(fetched_ids, STUDENT_ID_CACHE_TTL)
+        return results
 
 # -------- ITP Helpers --------
-def initialize_itp(itp_payload):
+async def initialize_itp(http, itp_payload):
     headers = {"Content-Type": "application/json"}
-    print("INIT PAYLOAD:", json.dumps(itp_payload, indent=2))
-    resp = requests.post(url_itp_initialize, headers=headers, data=json.dumps(itp_payload))
-    return resp.text
+    logger.debug("INIT PAYLOAD: %s", itp_payload)
+    resp = await http.post(url_itp_initialize, headers=headers, content=orjson.dumps(itp_payload))
+    return resp.content
+
+
+# Status reads only need these two attributes, not the whole series blob
+ITP_STATUS_PROJECTION = {
+    "ProjectionExpression": "#g, series_title",
+    "ExpressionAttributeNames": {"#g": "Generated"}
+}
+
+
+def _itp_status_response(itp_id, question_item):
+    if "Item" in question_item:
+        item = question_item["Item"]
+        if item.get("Generated") is True:
+            return {
+                "statusCode": 200,
+                "isGenerated": True,
+                "body": {"id": itp_id, "series_title": item.get("series_title")}
+            }
+        elif item.get("Generated") is False:
+            return {
+                "statusCode": 200,
+                "id": itp_id,
+                "isGenerated": False,
+                "title": item.get("series_title")
+            }
+        else:
+            return {"statusCode": 400, "isGenerated": "error"}
+    else:
+        return {"statusCode": 404, "message": "ITP not found"}
 
 
 def check_itp_status_local(itp_id, user_id=None, pre_defined=True):
     try:
         if pre_defined:
-            question_item = Question_Prod.get_item(Key={"id": itp_id})
+            question_item = Question_Prod.get_item(Key={"id": itp_id}, **ITP_STATUS_PROJECTION)
         else:
-            question_item = User_ITP_Prod.get_item(Key={"email": user_id, "id": itp_id})
-
-        if "Item" in question_item:
-            item = question_item["Item"]
-            if item.get("Generated") is True:
-                return {
-                    "statusCode": 200,
-                    "isGenerated": True,
-                    "body": {"id": itp_id, "series_title": item.get("series_title")}
-                }
-            elif item.get("Generated") is False:
-                return {
-                    "statusCode": 200,
-                    "id": itp_id,
-                    "isGenerated": False,
-                    "title": item.get("series_title")
-                }
-            else:
-                return {"statusCode": 400, "isGenerated": "error"}
+            question_item = User_ITP_Prod.get_item(Key={"email": user_id, "id": itp_id}, **ITP_STATUS_PROJECTION)
+        return _itp_status_response(itp_id, question_item)
+    except Exception as e:
+        logger.error("Error checking ITP status: %s", e)
+        return {"statusCode": 500, "error": str(e)}
+
+
+async def check_itp_status_async(table, itp_id, user_id=None, pre_defined=True):
+    """
+    Read ITP status through an already open aioboto3 Table, so a whole wait
+    shares one client and its connection pool.
+    """
+    try:
+        if pre_defined:
+            key = {"id": itp_id}
         else:
-            return {"statusCode": 404, "message": "ITP not found"}
+            key = {"email": user_id, "id": itp_id}
+        question_item = await table.get_item(Key=key, **ITP_STATUS_PROJECTION)
+        return _itp_status_response(itp_id, question_item)
     except Exception as e:
-        print("Error checking ITP status:", e)
+        logger.error("Error checking ITP status: %s", e)
         return {"statusCode": 500, "error": str(e)}
 
+
+async def wait_for_itp(itp_id, user_id=None, initial_delay=0.5, max_delay=10):
+    """
+    Poll Question_Prod until the ITP is generated, backing off from
+    initial_delay to max_delay between reads. The event loop is released
+    between attempts; callers bound the total wait with asyncio.wait_for.
+    """
+    async with aio_session.resource("dynamodb", config=aws_config) as ddb:
+        table = await ddb.Table(Question_Prod.name)
+        attempt = 0
+        delay = initial_delay
+        while True:
+            await asyncio.sleep(delay)
+            attempt += 1
+            check_resp = await check_itp_status_async(table, itp_id, user_id, pre_defined=True)
+            logger.info("[POLL LOOP] Attempt %d (after %.1fs): %s", attempt, delay, check_resp)
+
+            if check_resp.get("isGenerated"):
+                return check_resp
+
+            delay = min(delay * 1.7, max_delay)
+
+# ------------------- Background Tasks -------------------
+@celery.task(name="finalize_lesson")
+def finalize_lesson(lesson_data, subject, tenantEmail):
+    """
+    Steps 2-3 of process_all, run off the request when a broker is configured:
+    insert the subject through the School API, then assign it to the lesson's
+    students and teacher.
+    """
+    lesson_uuid = lesson_data["lesson_planner_UUID"]
+    grade = lesson_data.get("grade", "")
+    section = lesson_data.get("section", "")
+    period = lesson_data.get("period", "")
+    teacher_id = lesson_data.get("teacher_id")
+
+    # Step 2: Insert subject via School API
+    subject_id = None
+    subject_resp = None
+    try:
+        headers = SCHOOL_API_HEADERS
+        school_id = get_school_id(tenantEmail)
+
+        if school_id:
+            payload = {
+                "name": subject,
+                "grade": grade,
+                "section": section,
+                "school_id": school_id,
+                "period": period
+            }
+            resp = http_session.post(url_insert_subject, headers=headers, data=orjson.dumps(payload))
+            logger.info("[Insert Subject API] status=%s, response=%s", resp.status_code, resp.text)
+
+            if resp.status_code == 200 and resp.text.strip():
+                subject_resp = orjson.loads(resp.content)
+                subject_id = subject_resp.get("inserted_subject_id")
+    except Exception as e:
+        logger.warning("Error inserting subject: %s", e)
+
+    assigned = []
+    not_found = []
+    failed = []
+
+    # Step 2.5 & 3 only if new subject was inserted (not already_exists)
+    if subject_resp and subject_resp.get("status") == "Query executed":
+        # Step 2.5: Assign subject to students
+        students = lesson_data.get("student", [])
+        if subject_id and students:
+            results = asyncio.run(assign_subject_to_students(students, subject_id))
+            for student_email, student_id, assign_resp in results:
+                if student_id:
+                    if assign_resp.get("status") == "assigned":
+                        assigned.append({"email": student_email, "student_id": student_id})
+                        logger.info("[STEP 2.5] Assigned subject %s to %s (id=%s)", subject_id, student_email, student_id)
+                    else:
+                        failed.append({"email": student_email, "student_id": student_id, "resp": assign_resp})
+                        logger.warning("[STEP 2.5] Assignment failed for %s: %s", student_email, assign_resp)
+                else:
+                    not_found.append(student_email)
+                    logger.info("[STEP 2.5] Could not fetch student_id for %s", student_email)
+
+        # Step 3: Insert subject-teacher relation
+        if subject_id and teacher_id:
+            insert_subject_teacher_relation(subject_id, teacher_id)
+            logger.info("[STEP 3] Inserted subject-teacher relation (subject_id=%s, teacher_id=%s)", subject_id, teacher_id)
+        else:
+            logger.info("[STEP 3] Skipped subject-teacher relation (missing subject_id or teacher_id)")
+
+    elif subject_resp and subject_resp.get("status") == "already_exists":
+        logger.info("[STEP 2] Subject already exists, skipping Step 2.5 and 3 (subject_id=%s)", subject_id)
+
+    logger.info("=== [PROCESS_ALL END SUCCESS] ===")
+
+    return {
+        "uuid": lesson_uuid,
+        "subject_id": subject_id,
+        "message": f"Subject {subject} processed successfully.",
+        "assigned_students": assigned,
+        "not_found_students": not_found,
+        "failed_assignments": failed
+    }
+
+
 # ------------------- Flask Endpoints -------------------
 @app.route("/process_all", methods=["POST"])
 def process_all():
@@ -542,16 +1024,13 @@ def process_all():
         lesson_uuid = lesson_data["lesson_planner_UUID"]
 
         now = strftime("%Y-%m-%d,%H:%M:%S", gmtime())
-        tenantEmail = "sierracanyon@edyou.com"
-        tenantName = "Sierra Canyon"
-        icon = "https://pollydemo2022.s3.us-west-2.amazonaws.com/icons/homework.png"
+        tenantEmail = LESSON_TENANT_EMAIL
 
         grade = lesson_data.get("grade", "")
         section = lesson_data.get("section", "")
         period = lesson_data.get("period", "")
-        teacher_id = lesson_data.get("teacher_id")
 
-        print("=== [PROCESS_ALL START] ===")
+        logger.info("=== [PROCESS_ALL START] ===")
 
         # Step 1: Dynamo insert
         item = {
@@ -560,120 +1039,67 @@ def process_all():
             "Grade": grade,
             "Grade_and_Subject": f"TD: {subject}",
             "Grade_and_Subject_UI": f"{subject} - Assignment",
-            "status": "Active",
             "Subject": subject,
-            "tenantEmail": tenantEmail,
-            "tenantName": tenantName,
-            "quiz_credit": Decimal(0),
-            "course_credit": Decimal(0),
-            "icon": icon,
             "Period": period,
             "Section": section
         }
-        Grade_and_Subject.put_item(Item=item)
-        print("[STEP 1] Inserted into DynamoDB Grade_and_Subject")
-
-        # Step 2: Insert subject via School API
-        subject_id = None
-        subject_resp = None
-        try:
-            headers = {
-                "x-api-key": os.getenv("LESSON_PLANNER_API_KEY"),
-                "Content-Type": "application/json"
+        dynamodb.meta.client.put_item(
+            TableName=Grade_and_Subject.name,
+            Item={
+                **GRADE_SUBJECT_STATIC_ITEM,
+                **{key: dynamo_serializer.serialize(value) for key, value in item.items()}
             }
-            school_resp = requests.post(
-                url_get_school,
-                headers=headers,
-                data=json.dumps({"email": tenantEmail})
-            )
-            school_id = None
-            if school_resp.text.strip():
-                school_data = school_resp.json()
-                if isinstance(school_data, list) and school_data:
-                    school_id = school_data[0].get("school_id")
-
-            if school_id:
-                payload = {
-                    "name": subject,
-                    "grade": grade,
-                    "section": section,
-                    "school_id": school_id,
-                    "period": period
-                }
-                resp = requests.post(url_insert_subject, headers=headers, json=payload)
-                print(f"[Insert Subject API] status={resp.status_code}, response={resp.text}")
-
-                if resp.status_code == 200 and resp.text.strip():
-                    subject_resp = resp.json()
-                    subject_id = subject_resp.get("inserted_subject_id")
-        except Exception as e:
-            print(f"Error inserting subject: {e}")
-
-        assigned = []
-        not_found = []
-        failed = []
-
-        # Step 2.5 & 3 only if new subject was inserted (not already_exists)
-        if subject_resp and subject_resp.get("status") == "Query executed":
-            # Step 2.5: Assign subject to students
-            students = lesson_data.get("student", [])
-            if subject_id and students:
-                for student_email in students:
-                    student_id = get_student_id_by_email(student_email)
-                    if student_id:
-                        assign_resp = assign_subject_to_student(student_id, subject_id)
-                        if assign_resp.get("status") == "assigned":
-                            assigned.append({"email": student_email, "student_id": student_id})
-                            print(f"[STEP 2.5] Assigned subject {subject_id} to {student_email} (id={student_id})")
-                        else:
-                            failed.append({"email": student_email, "student_id": student_id, "resp": assign_resp})
-                            print(f"[STEP 2.5] Assignment failed for {student_email}: {assign_resp}")
-                    else:
-                        not_found.append(student_email)
-                        print(f"[STEP 2.5] Could not fetch student_id for {student_email}")
-
-            # Step 3: Insert subject-teacher relation
-            if subject_id and teacher_id:
-                insert_subject_teacher_relation(subject_id, teacher_id)
-                print(f"[STEP 3] Inserted subject-teacher relation (subject_id={subject_id}, teacher_id={teacher_id})")
-            else:
-                print("[STEP 3] Skipped subject-teacher relation (missing subject_id or teacher_id)")
+        )
+        logger.info("[STEP 1] Inserted into DynamoDB Grade_and_Subject")
 
-        elif subject_resp and subject_resp.get("status") == "already_exists":
-            print(f"[STEP 2] Subject already exists, skipping Step 2.5 and 3 (subject_id={subject_id})")
+        # Without a broker, run Steps 2-3 in the request and reply with their outcome
+        if not celery_broker_url:
+            result = finalize_lesson(lesson_data, subject, tenantEmail)
+            return jsonify({"status": "success", **result}), 200
 
-        print("=== [PROCESS_ALL END SUCCESS] ===")
+        # Steps 2-3 run on a Celery worker; poll /jobs/<job_id> for the outcome
+        job = finalize_lesson.delay(lesson_data, subject, tenantEmail)
 
         return jsonify({
-            "status": "success",
+            "status": "accepted",
             "uuid": lesson_uuid,
-            "subject_id": subject_id,
-            "message": f"Subject {subject} processed successfully.",
-            "assigned_students": assigned,
-            "not_found_students": not_found,
-            "failed_assignments": failed
-        }), 200
+            "job_id": job.id,
+            "message": f"Subject {subject} queued for processing."
+        }), 202
 
     except Exception as e:
-        print("=== [PROCESS_ALL ERROR] ===")
-        print(traceback.format_exc())
+        logger.exception("process_all failed")
         return jsonify({
             "status": "error",
-            "error": str(e),
-            "trace": traceback.format_exc()
+            "error": str(e)
         }), 400
 
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+def api_job_status(job_id):
+    if not celery_broker_url or not celery_result_backend:
+        return jsonify({
+            "status": "error",
+            "message": "Job tracking requires CELERY_BROKER_URL and CELERY_RESULT_BACKEND"
+        }), 404
+
+    result = AsyncResult(job_id, app=celery)
+    body = {"job_id": job_id, "state": result.state}
+    if result.successful():
+        body["result"] = result.result
+    elif result.failed():
+        body["error"] = str(result.result)
+    return jsonify(body), 200
+
+
 @app.route("/generate_itp", methods=["POST"])
-def api_generate_itp():
+async def api_generate_itp():
     try:
         data = request.json
-        init_resp = json.loads(initialize_itp(data))
+        async with httpx.AsyncClient(timeout=OUTBOUND_HTTP_TIMEOUT) as http:
+            init_resp = orjson.loads(await initialize_itp(http, data))
 
-        print("*******************************")
-        print(init_resp)
-        print(init_resp['statusCode'])
-        print("*******************************")
+        logger.info("ITP initialize response: %s", init_resp)
 
         # Case 1: ITP already generated
         if init_resp['statusCode'] == 400:
@@ -684,27 +1110,30 @@ def api_generate_itp():
             itp_id = init_resp['body']["id"]
             user_id = data.get("user_id")
 
-            max_attempts = 80   # ~4 minutes if interval=3s
-            interval = 3        # seconds
+            timeout = 240   # seconds (~4 minutes)
 
-            for attempt in range(max_attempts):
-                time.sleep(interval)
-                check_resp = check_itp_status_local(itp_id, user_id, pre_defined=True)
-                print(f"[POLL LOOP] Attempt {attempt+1}/{max_attempts}: {check_resp}")
+            try:
+                check_resp = await asyncio.wait_for(wait_for_itp(itp_id, user_id), timeout=timeout)
+            except asyncio.TimeoutError:
+                return jsonify({
+                    "status": "timeout",
+                    "message": "ITP generation still in progress after 4 minutes",
+                    "id": itp_id
+                }), 202
 
-                if check_resp.get("isGenerated"):
-                    return jsonify({
-                        "status": "success",
-                        "message": "ITP generated successfully",
-                        "data": check_resp
-                    }), 200
+            # A malformed item reports isGenerated="error"; only True is success
+            if check_resp.get("isGenerated") is not True:
+                return jsonify({
+                    "status": "error",
+                    "message": "ITP status could not be confirmed",
+                    "data": check_resp
+                }), 502
 
-            # Timed out
             return jsonify({
-                "status": "timeout",
-                "message": "ITP generation still in progress after 4 minutes",
-                "id": itp_id
-            }), 202
+                "status": "success",
+                "message": "ITP generated successfully",
+                "data": check_resp
+            }), 200
 
         # Case 3: Unexpected but OK → just return init response
         if init_resp['statusCode'] == 200:
@@ -718,18 +1147,18 @@ def api_generate_itp():
         }), 400
 
     except Exception as e:
+        logger.exception("generate_itp failed")
         return jsonify({
             "status": "error",
-            "error": str(e),
-            "trace": traceback.format_exc()
+            "error": str(e)
         }), 500
 
 
 @app.route("/generate_icp", methods=["POST"])
-def api_generate_icp():
+async def api_generate_icp():
     # try:
         data = request.json
-        # print("[ICP] Incoming request:", json.dumps(data, indent=2))
+        logger.debug("[ICP] Incoming request: %s", data)
 
         subject_id = data.get("subject_id")
         topic_id = data.get("topic_id")
@@ -742,20 +1171,20 @@ def api_generate_icp():
             "icp_UUID": data["icp_UUID"],
             "description": data["description"]
         }
-        # print("[ICP] Generate payload:", json.dumps(generate_payload, indent=2))
+        logger.debug("[ICP] Generate payload: %s", generate_payload)
 
-        resp_generate = requests.post(
-            url_icp_generate,
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(generate_payload)
-        )
+        async with httpx.AsyncClient(timeout=OUTBOUND_HTTP_TIMEOUT) as http:
+            resp_generate = await http.post(
+                url_icp_generate,
+                headers={"Content-Type": "application/json"},
+                content=orjson.dumps(generate_payload)
+            )
 
-        # print
-        print(f"[ICP] Generate API status: {resp_generate.status_code}")
-        print(f"[ICP] Generate API raw text (first 500 chars): {resp_generate.text[:500]}")
+        logger.info("[ICP] Generate API status: %s", resp_generate.status_code)
+        logger.debug("[ICP] Generate API raw body (first 500 bytes): %.500s", resp_generate.content)
         
         if resp_generate.status_code == 200:
-            resp = json.loads(resp_generate.text)
+            resp = orjson.loads(resp_generate.content)
             payload_1 ={
                 "user_id":tenantEmail,
                 "body":{   
@@ -766,7 +1195,16 @@ def api_generate_icp():
                 "topic_id": topic_id
             }}
 
-            invoke_resp = invoke_lambda(payload_1)
+            # Callers that only need an ack poll /icp_status instead of waiting
+            if request.args.get("fire_and_forget") == "1":
+                request_id = await invoke_lambda_event(payload_1)
+                return jsonify({
+                    "status": "accepted",
+                    "request_id": request_id,
+                    "icp_UUID": data["icp_UUID"]
+                }), 202
+
+            invoke_resp = await invoke_lambda(payload_1)
 
             if invoke_resp["statusCode"] == 200:
                 return jsonify({
@@ -779,6 +1217,20 @@ def api_generate_icp():
                 }), 400 
 
 
+@app.route("/icp_status", methods=["GET"])
+def api_icp_status():
+    icp_uuid = request.args.get("icp_UUID")
+    if not icp_uuid:
+        return jsonify({
+            "status": "error",
+            "message": "icp_UUID is required"
+        }), 400
+
+    # createPredefinedModule marks completion on the Question item for icp_UUID
+    check_resp = check_itp_status_local(icp_uuid, pre_defined=True)
+    return jsonify(check_resp), check_resp["statusCode"]
+
+
 
 @app.route("/update_student_subjects", methods=["POST"])
 def api_update_student_subjects():
@@ -795,36 +1247,26 @@ def api_update_student_subjects():
                 "message": "body.lesson_planner_UUID and body.student[] are required"
             }), 400
 
-        # --- Step 4 (moved here) ---
-        insert_lesson_planner_payload(body)
-        print("[STEP 4] Inserted lesson planner into Postgres API")
-
         updated = []
         not_found = []
         already_linked = []
 
-        for email in students:
-            resp = Investor.get_item(Key={"email": email})
-            if "Item" not in resp and email.lower() != email:
-                resp = Investor.get_item(Key={"email": email.lower()})
-
-            if "Item" not in resp:
+        # The Postgres insert and the Investor updates touch unrelated systems,
+        # so run them side by side; an insert failure still fails the request.
+        with ThreadPoolExecutor(max_workers=STUDENT_UPDATE_WORKERS + 1) as pool:
+            # --- Step 4 (moved here) ---
+            lesson_insert = pool.submit(insert_lesson_planner_payload, body)
+            results = list(pool.map(lambda e: link_subject_to_student(e, lesson_uuid), students))
+            lesson_insert.result()
+            logger.info("[STEP 4] Inserted lesson planner into Postgres API")
+
+        for email, (status, stored_email) in zip(students, results):
+            if status == "not_found":
                 not_found.append(email)
-                continue
-
-            student_item = resp["Item"]
-            subject_list = student_item.get("subject_list", [])
-
-            if lesson_uuid in subject_list:
-                already_linked.append(student_item["email"])
+            elif status == "already_linked":
+                already_linked.append(stored_email)
             else:
-                subject_list.append(lesson_uuid)
-                Investor.update_item(
-                    Key={"email": student_item["email"]},
-                    UpdateExpression="SET subject_list = :s",
-                    ExpressionAttributeValues={":s": subject_list}
-                )
-                updated.append(student_item["email"])
+                updated.append(stored_email)
 
         return jsonify({
             "status": "success",
@@ -835,41 +1277,57 @@ def api_update_student_subjects():
         }), 200
 
     except Exception as e:
-        print("=== [UPDATE_STUDENT_SUBJECTS ERROR] ===")
-        print(traceback.format_exc())
+        logger.exception("update_student_subjects failed")
         return jsonify({
             "status": "error",
-            "error": str(e),
-            "trace": traceback.format_exc()
+            "error": str(e)
         }), 500
 
 
 
-def invoke_lambda(payload):
+async def invoke_lambda(payload):
     # The name of your Lambda function
     function_name = 'createPredefinedModule'
 
     # Payload received from POST request
     
     alias_name = 'Production' #Production
-    # Invoke Lambda
-    response = lambda_client.invoke(
-        FunctionName=function_name,
-        InvocationType='RequestResponse',  # 'Event' for async, 'RequestResponse' for sync
-        Payload=json.dumps(payload),
-        Qualifier=alias_name
-    )
+    # Invoke Lambda; the await releases the worker while the module is built
+    async with aio_session.client("lambda", config=lambda_config) as lambda_client:
+        response = await lambda_client.invoke(
+            FunctionName=function_name,
+            InvocationType='RequestResponse',  # 'Event' for async, 'RequestResponse' for sync
+            Payload=orjson.dumps(payload),
+            Qualifier=alias_name
+        )
 
-    # Read response from Lambda
-    response_payload = response['Payload'].read()
-    result = json.loads(response_payload)
+        # Read response from Lambda
+        response_payload = await response['Payload'].read()
+
+    result = orjson.loads(response_payload)
 
     return result
 
 
+async def invoke_lambda_event(payload):
+    """
+    Queue createPredefinedModule without waiting for it to run.
+    Returns the invocation's RequestId.
+    """
+    async with aio_session.client("lambda", config=lambda_config) as lambda_client:
+        response = await lambda_client.invoke(
+            FunctionName='createPredefinedModule',
+            InvocationType='Event',
+            Payload=orjson.dumps(payload),
+            Qualifier='Production'
+        )
+    return response['ResponseMetadata']['RequestId']
+
+
 
 
 # ==================== Run ====================
 
+# Local development only; production is served by gunicorn (gunicorn.conf.py)
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    app.run(debug=env != "Production", port=5000)
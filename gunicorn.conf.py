@@ -0,0 +1,19 @@
+import multiprocessing
+import os
+
+# Production server: gunicorn app:app (this file is picked up automatically).
+# The gevent worker monkey-patches sockets before the app is imported, so the
+# blocking requests/boto3 calls yield to other requests on the same worker.
+# GUNICORN_WORKER_CLASS=gthread switches to OS threads (sized by GUNICORN_THREADS).
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.getenv("WEB_CONCURRENCY", min(2 * multiprocessing.cpu_count() + 1, 8)))
+worker_connections = 1000
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+# Hold idle connections open longer than the load balancer's idle timeout (60s)
+keepalive = 75
+
+# /generate_itp can hold a request for ~4 minutes while the ITP is generated
+timeout = 300
+graceful_timeout = 30